@@ -5,9 +5,10 @@ GitHub QQ Bot - 监控GitHub仓库提交并发送总结到QQ群
 
 import asyncio
 import json
-import time
+import signal
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 
 import click
 from loguru import logger
@@ -18,13 +19,17 @@ from src.ai_summarizer import AISummarizer
 from src.qq_bot import QQBot
 from src.config import Config
 from src.database import Database
-import ssl
-
-ssl._create_default_https_context = ssl._create_unverified_context
+from src.rate_limiter import AsyncLeakyBucket
 
 # 加载环境变量
 load_dotenv()
 
+# AI总结时获取文件变更的提交数上限
+AI_FILES_TOP_K = 10
+
+# GitHub请求的突发容量，超出后按每小时5000次的平均速率发送
+GITHUB_BURST = 60
+
 
 @click.group()
 @click.version_option(version="1.0.0")
@@ -43,16 +48,21 @@ def run(config):
         
         # 初始化组件
         db = Database(config_obj.database_path)
-        github_monitor = GitHubMonitor(config_obj.github_token)
+        # GitHub认证用户每小时5000次请求，约1.4次/秒；突发容量足够一轮列表加详情请求直接发出
+        github_limiter = AsyncLeakyBucket(5000 / 3600, GITHUB_BURST)
+        openai_limiter = AsyncLeakyBucket(config_obj.openai_rpm / 60, 1)
+        github_monitor = GitHubMonitor(config_obj.github_token, db, github_limiter,
+                                       config_obj.github_concurrency)
         ai_summarizer = AISummarizer(
             config_obj.openai_api_key, 
             config_obj.openai_base_url,
-            config_obj.openai_model
+            config_obj.openai_model,
+            openai_limiter
         )
         qq_bot = QQBot(config_obj.qq_bot_url, config_obj.qq_group_id)
         
         # 获取仓库配置
-        repo_configs = config_obj.get_repo_configs()
+        repo_configs = config_obj.repo_configs
         
         logger.info("🚀 启动GitHub QQ Bot监控服务...")
         for repo_config in repo_configs:
@@ -61,30 +71,116 @@ def run(config):
         logger.info(f"检查间隔: {config_obj.check_interval}秒")
         
         # 主循环
+        try:
+            asyncio.run(_run_async(repo_configs, config_obj.check_interval, db,
+                                   github_monitor, ai_summarizer, qq_bot))
+        except KeyboardInterrupt:
+            # 不支持add_signal_handler的平台（Windows）通过KeyboardInterrupt退出
+            logger.info("👋 收到退出信号，停止服务...")
+        finally:
+            db.close()
+    
+    except Exception as e:
+        logger.error(f"❌ 启动失败: {e}")
+        click.echo(f"错误: {e}", err=True)
+
+
+async def _run_async(repo_configs, check_interval: int, db: Database, github_monitor: GitHubMonitor,
+                     ai_summarizer: AISummarizer, qq_bot: QQBot):
+    """主循环：定时检查所有仓库，等待期间不阻塞事件循环"""
+    loop = asyncio.get_running_loop()
+    main_task = asyncio.current_task()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, main_task.cancel)
+        except (NotImplementedError, AttributeError):
+            pass
+    
+    try:
         while True:
             try:
-                # 检查每个仓库
-                for repo_config in repo_configs:
-                    asyncio.run(process_repo(repo_config, db, github_monitor, ai_summarizer, qq_bot))
+                # 并发检查所有仓库
+                await _tick(repo_configs, db, github_monitor, ai_summarizer, qq_bot)
                 
-                logger.info(f"💤 等待{config_obj.check_interval}秒后继续检查...")
-                time.sleep(config_obj.check_interval)
+                logger.info(f"💤 等待{check_interval}秒后继续检查...")
+                await asyncio.sleep(check_interval)
                 
-            except KeyboardInterrupt:
+            except asyncio.CancelledError:
                 logger.info("👋 收到退出信号，停止服务...")
                 break
             except Exception as e:
                 logger.error(f"❌ 处理过程中出错: {e}")
-                time.sleep(60)  # 出错后等待1分钟再继续
+                try:
+                    await asyncio.sleep(60)  # 出错后等待1分钟再继续
+                except asyncio.CancelledError:
+                    logger.info("👋 收到退出信号，停止服务...")
+                    break
+    finally:
+        # 会话在整个运行期间复用，退出时统一关闭
+        await github_monitor.close()
+        await qq_bot.close()
+
+
+async def _tick(repo_configs, db: Database, github_monitor: GitHubMonitor,
+                ai_summarizer: AISummarizer, qq_bot: QQBot):
+    """执行一轮检查：并发获取所有仓库的新提交，一次性生成总结后并发发送"""
+    github_semaphore = asyncio.Semaphore(8)  # 限制同时访问GitHub的仓库数
+    
+    # 一次查询取出所有仓库的检查状态
+    states = db.get_states([repo_config.repo for repo_config in repo_configs])
+    
+    # 先用一次GraphQL请求获取所有仓库的新提交，失败的仓库再逐个走REST接口
+    since_map = {repo: state[0] for repo, state in states.items()}
+    sha_map = {repo: state[1] for repo, state in states.items()}
+    bulk_commits = await github_monitor.fetch_bulk_commits(repo_configs, since_map, sha_map)
+    
+    results = await asyncio.gather(
+        *(collect_new_commits(repo_config, states[repo_config.repo], github_monitor, github_semaphore,
+                              bulk_commits.get(repo_config.repo))
+          for repo_config in repo_configs),
+        return_exceptions=True
+    )
     
+    repo_commits: Dict[str, List[Dict]] = {}
+    for repo_config, result in zip(repo_configs, results):
+        if isinstance(result, BaseException):
+            logger.error(f"❌ 处理仓库 {repo_config.repo} 时出错: {result}")
+        elif result:
+            repo_commits[repo_config.repo] = result
+    
+    if not repo_commits:
+        return
+    
+    # 所有有新提交的仓库合并为一次AI请求
+    try:
+        if ai_summarizer.enabled:
+            # 文件变更只在AI总结时用到，此时才获取提交详情
+            hydrated = await asyncio.gather(
+                *(github_monitor.hydrate_files(repo, commits, AI_FILES_TOP_K)
+                  for repo, commits in repo_commits.items())
+            )
+            repo_commits = dict(zip(repo_commits, hydrated))
+        
+        summaries = await ai_summarizer.summarize_many(repo_commits)
+        logger.info("✅ 生成提交总结完成")
     except Exception as e:
-        logger.error(f"❌ 启动失败: {e}")
-        click.echo(f"错误: {e}", err=True)
+        logger.error(f"❌ 生成提交总结失败: {e}")
+        summaries = {}
+    
+    await asyncio.gather(
+        *(send_summary(repo, commits, summaries.get(repo) or _build_fallback_summary(repo, commits), db, qq_bot)
+          for repo, commits in repo_commits.items())
+    )
 
 
-async def process_repo(repo_config, db: Database, github_monitor: GitHubMonitor, 
-                      ai_summarizer: AISummarizer, qq_bot: QQBot):
-    """处理单个仓库的提交检查"""
+async def collect_new_commits(repo_config, state: Tuple[Optional[datetime], Optional[str], Optional[str]],
+                              github_monitor: GitHubMonitor,
+                              github_semaphore: Optional[asyncio.Semaphore] = None,
+                              prefetched: Optional[List[Dict]] = None) -> List[Dict]:
+    """获取单个仓库的新提交
+    
+    state为预先查询的 (最后检查时间, 最后提交SHA, ETag)，prefetched为批量查询已获取的结果
+    """
     repo = repo_config.repo
     branches = repo_config.branches
     
@@ -92,55 +188,75 @@ async def process_repo(repo_config, db: Database, github_monitor: GitHubMonitor,
         branch_info = ", ".join(branches) if branches != ["*"] else "所有分支"
         logger.info(f"🔍 检查仓库 {repo} 的新提交 (分支: {branch_info})...")
         
-        # 获取最后检查时间和SHA
-        last_check = db.get_last_check_time(repo)
-        last_commit_sha = db.get_last_commit_sha(repo)
-        
-        # 获取新提交（使用SHA过滤避免重复，传递分支配置）
-        commits = await github_monitor.get_new_commits(repo, last_check, last_commit_sha, branches)
+        if prefetched is not None:
+            commits = prefetched
+        else:
+            if github_semaphore is not None:
+                async with github_semaphore:
+                    commits = await _list_commits_rest(repo, branches, state, github_monitor)
+            else:
+                commits = await _list_commits_rest(repo, branches, state, github_monitor)
         
         if not commits:
             logger.info(f"✅ {repo} 没有新提交")
-            return
+            return []
         
-        logger.info(f"📝 发现 {len(commits)} 个新提交:")
+        logger.info(f"📝 {repo} 发现 {len(commits)} 个新提交:")
         for commit in commits:
             logger.info(f"  - {commit['sha']}: {commit['message'][:50]}{'...' if len(commit['message']) > 50 else ''}")
         
-        # 生成提交总结
-        try:
-            summary = await ai_summarizer.summarize_commits(repo, commits)
-            logger.info("✅ 生成提交总结完成")
-        except Exception as e:
-            logger.error(f"❌ 生成提交总结失败: {e}")
-            # 如果AI总结失败，发送简单的提交列表
-            summary = f"🔄 仓库 {repo} 有 {len(commits)} 个新提交:\n\n"
-            for commit in commits[:5]:  # 最多显示5个
-                summary += f"• {commit['sha']}: {commit['message'][:100]}{'...' if len(commit['message']) > 100 else ''}\n"
-                summary += f"  👤 {commit['author']} | 🔗 {commit['url']}\n\n"
-            if len(commits) > 5:
-                summary += f"... 还有 {len(commits) - 5} 个提交"
-        
-        # 发送到QQ群
-        try:
-            success = await qq_bot.send_message(summary)
-            if success:
-                logger.info(f"✅ {repo} 的提交总结已发送到QQ群")
-                
-                # 只有成功发送后才更新数据库
-                latest_commit = commits[-1]  # 最新的提交在最后
-                db.update_last_check_time(
-                    repo, 
-                    datetime.now(timezone.utc), 
-                    latest_commit['full_sha']
-                )
-            else:
-                logger.error("❌ 发送到QQ群失败，不更新检查时间")
-        except Exception as e:
-            logger.error(f"❌ 发送QQ消息时出错: {e}")
+        return commits
         
     except Exception as e:
         logger.error(f"❌ 处理仓库 {repo} 时出错: {e}", exc_info=True)
+        return []
+
+
+async def _list_commits_rest(repo: str, branches: List[str],
+                             state: Tuple[Optional[datetime], Optional[str], Optional[str]],
+                             github_monitor: GitHubMonitor) -> List[Dict]:
+    """通过REST接口获取单个仓库的新提交"""
+    last_check, last_commit_sha, etag = state
+    
+    # 只监控一个分支时，先取分支最新SHA，与上次处理的一致说明没有新提交
+    if last_commit_sha and len(branches) <= 1:
+        branch = "HEAD" if not branches or branches[0] == "*" else branches[0]
+        if await github_monitor.head_sha(repo, branch) == last_commit_sha:
+            return []
+    
+    # 获取新提交（使用SHA过滤避免重复，传递分支配置）
+    return await github_monitor.list_new_commits_lite(repo, last_check, last_commit_sha, branches, etag)
+
+
+def _build_fallback_summary(repo: str, commits: List[Dict]) -> str:
+    """AI总结失败时使用的简单提交列表"""
+    summary = f"🔄 仓库 {repo} 有 {len(commits)} 个新提交:\n\n"
+    for commit in commits[:5]:  # 最多显示5个
+        summary += f"• {commit['sha']}: {commit['message'][:100]}{'...' if len(commit['message']) > 100 else ''}\n"
+        summary += f"  👤 {commit['author']} | 🔗 {commit['url']}\n\n"
+    if len(commits) > 5:
+        summary += f"... 还有 {len(commits) - 5} 个提交"
+    return summary
+
+
+async def send_summary(repo: str, commits: List[Dict], summary: str, db: Database, qq_bot: QQBot):
+    """发送仓库总结到QQ群，成功后更新检查状态"""
+    try:
+        success = await qq_bot.send_message(summary)
+        if success:
+            logger.info(f"✅ {repo} 的提交总结已发送到QQ群")
+            
+            # 只有成功发送后才更新数据库
+            latest_commit = commits[-1]  # 最新的提交在最后
+            db.update_last_check_time(
+                repo, 
+                datetime.now(timezone.utc), 
+                latest_commit['full_sha']
+            )
+        else:
+            logger.error(f"❌ {repo} 发送到QQ群失败，不更新检查时间")
+    except Exception as e:
+        logger.error(f"❌ 发送QQ消息时出错: {e}")
 
 
 @cli.command()
@@ -187,8 +303,10 @@ def test(repo, config):
     try:
         config_obj = Config.from_file(config)
         
-        # 初始化组件
-        github_monitor = GitHubMonitor(config_obj.github_token)
+        # 初始化组件（共用运行服务时的提交详情缓存）
+        db = Database(config_obj.database_path)
+        github_monitor = GitHubMonitor(config_obj.github_token, db,
+                                       concurrency=config_obj.github_concurrency)
         ai_summarizer = AISummarizer(
             config_obj.openai_api_key, 
             config_obj.openai_base_url,
@@ -198,7 +316,16 @@ def test(repo, config):
         click.echo(f"🧪 测试仓库: {repo}")
         
         # 获取最近的提交
-        commits = asyncio.run(github_monitor.get_recent_commits(repo, limit=3))
+        async def fetch_recent_commits():
+            try:
+                return await github_monitor.get_recent_commits(repo, limit=3)
+            finally:
+                await github_monitor.close()
+        
+        try:
+            commits = asyncio.run(fetch_recent_commits())
+        finally:
+            db.close()
         
         if not commits:
             click.echo("没有找到提交记录")
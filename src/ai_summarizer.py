@@ -2,29 +2,18 @@
 AI总结模块 - 使用大模型生成提交总结
 """
 
+import asyncio
+import json
 import openai
-from typing import List, Dict
+from typing import List, Dict, Optional, AsyncIterator
 from loguru import logger
 
+from .rate_limiter import AsyncLeakyBucket
 
-class AISummarizer:
-    """AI提交总结器"""
-    
-    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", model: str = "gpt-3.5-turbo"):
-        self.client = openai.AsyncOpenAI(
-            api_key=api_key,
-            base_url=base_url
-        )
-        self.model = model
-    
-    async def summarize_commits(self, repo: str, commits: List[Dict]) -> str:
-        """生成提交总结"""
-        try:
-            # 构建提交信息文本
-            commits_text = self._format_commits_for_ai(commits)
-            
-            # 构建提示词
-            prompt = f"""
+
+_SYSTEM_PROMPT = "你是一个专业的代码提交总结助手，能够简洁明了地总结GitHub提交记录。"
+
+_PROMPT = """
 请帮我总结以下GitHub仓库的提交记录，用中文回答：
 
 仓库：{repo}
@@ -40,54 +29,200 @@ class AISummarizer:
 总结应该简洁明了，适合在QQ群中分享。如果有多个提交，请按重要性排序。
 """
 
+_BATCH_PROMPT = """
+请帮我分别总结以下多个GitHub仓库的提交记录，用中文回答。
+
+{repos_text}
+
+请为每个仓库生成一个简洁的总结，包括：
+1. 主要功能更新
+2. Bug修复
+3. 代码优化
+4. 其他重要变更
+
+总结应该简洁明了，适合在QQ群中分享。如果有多个提交，请按重要性排序。
+请只返回一个JSON对象，键为仓库名（{repo_keys}），值为该仓库的总结文本。
+"""
+
+# 每个仓库总结的token预算，以及一次请求的最大输出token数（gpt-3.5-turbo为4096）
+_TOKENS_PER_REPO = 800
+_MAX_COMPLETION_TOKENS = 4096
+
+_REPO_SECTION = "仓库：{repo}\n提交记录：\n{commits_text}"
+_REPO_SEPARATOR = "\n" + "=" * 50 + "\n"
+
+
+class AISummarizer:
+    """AI提交总结器"""
+    
+    def __init__(self, api_key: str, base_url: str = "https://api.openai.com/v1", model: str = "gpt-3.5-turbo",
+                 rate_limiter: Optional[AsyncLeakyBucket] = None):
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url
+        )
+        self.model = model
+        self.rate_limiter = rate_limiter  # 可选，按模型RPM限制请求速率
+        # 未配置API密钥时不调用模型，直接生成简单总结
+        self.enabled = bool(api_key)
+        # 流式输出时两段内容之间的最长等待时间（秒），超时视为卡住
+        self.stream_timeout = 30
+    
+    async def summarize_commits(self, repo: str, commits: List[Dict]) -> str:
+        """生成提交总结"""
+        if not self.enabled:
+            return self._generate_simple_summary(repo, commits)
+        
+        try:
+            parts = [part async for part in self.summarize_commits_stream(repo, commits)]
+            summary = "".join(parts).strip()
+            
+            assert summary
+            return self._wrap_summary(repo, summary)
+            
+        except Exception as e:
+            logger.error(f"生成AI总结时出错: {e}")
+            # 返回简单的提交列表作为备用
+            return self._generate_simple_summary(repo, commits)
+    
+    async def summarize_commits_stream(self, repo: str, commits: List[Dict]) -> AsyncIterator[str]:
+        """流式生成提交总结，逐段产出模型输出的文本（不含标题和链接）
+        
+        超过 stream_timeout 秒没有收到新内容时抛出 asyncio.TimeoutError。
+        """
+        # 构建提交信息文本
+        commits_text = self._format_commits_for_ai(commits)
+        
+        # 构建提示词
+        prompt = _PROMPT.format_map({"repo": repo, "commits_text": commits_text})
+        
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {"role": "system", "content": _SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=_TOKENS_PER_REPO,
+            stream=True
+        )
+        
+        chunks = stream.__aiter__()
+        try:
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=self.stream_timeout)
+                except StopAsyncIteration:
+                    break
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            await stream.response.aclose()
+    
+    async def summarize_many(self, repo_to_commits: Dict[str, List[Dict]]) -> Dict[str, str]:
+        """批量为多个仓库生成提交总结
+        
+        仓库按输出token上限分批，每批一次请求，各批并发进行。
+        """
+        if not repo_to_commits:
+            return {}
+        if not self.enabled:
+            return {repo: self._generate_simple_summary(repo, commits) for repo, commits in repo_to_commits.items()}
+        
+        repos = list(repo_to_commits)
+        batch_size = max(1, _MAX_COMPLETION_TOKENS // _TOKENS_PER_REPO)
+        results = await asyncio.gather(
+            *(self._summarize_batch({repo: repo_to_commits[repo] for repo in repos[i:i + batch_size]})
+              for i in range(0, len(repos), batch_size))
+        )
+        
+        summaries: Dict[str, str] = {}
+        for result in results:
+            summaries.update(result)
+        return summaries
+    
+    async def _summarize_batch(self, repo_to_commits: Dict[str, List[Dict]]) -> Dict[str, str]:
+        """在一次请求中为一批仓库生成提交总结
+        
+        模型以JSON对象 {仓库: 总结} 返回结果；解析失败或缺少某个仓库时，
+        对这些仓库逐个调用 summarize_commits。
+        """
+        if len(repo_to_commits) == 1:
+            repo, commits = next(iter(repo_to_commits.items()))
+            return {repo: await self.summarize_commits(repo, commits)}
+        
+        summaries: Dict[str, str] = {}
+        try:
+            repos_text = _REPO_SEPARATOR.join(
+                _REPO_SECTION.format_map({"repo": repo, "commits_text": self._format_commits_for_ai(commits)})
+                for repo, commits in repo_to_commits.items()
+            )
+            repo_keys = ", ".join(f'"{repo}"' for repo in repo_to_commits)
+            prompt = _BATCH_PROMPT.format_map({"repos_text": repos_text, "repo_keys": repo_keys})
+            
+            if self.rate_limiter:
+                await self.rate_limiter.acquire()
             response = await self.client.chat.completions.create(
                 model=self.model,
                 messages=[
-                    {"role": "system", "content": "你是一个专业的代码提交总结助手，能够简洁明了地总结GitHub提交记录。"},
+                    {"role": "system", "content": _SYSTEM_PROMPT},
                     {"role": "user", "content": prompt}
                 ],
                 temperature=0.7,
-                max_tokens=800
+                max_tokens=min(_TOKENS_PER_REPO * len(repo_to_commits), _MAX_COMPLETION_TOKENS),
+                response_format={"type": "json_object"}
             )
-            summary = response.choices[0].message.content
-            if summary:
-                summary= summary.strip()
-            
-            # 添加仓库链接和时间信息
-            header = f"📊 {repo} 代码更新总结\n" + "="*30 + "\n"
-            footer = f"\n🔗 查看详情：https://github.com/{repo}/commits"
-            
-            assert summary
-            return header + summary + footer
+            result = json.loads(response.choices[0].message.content or "")
             
+            for repo in repo_to_commits:
+                summary = result.get(repo)
+                if isinstance(summary, str) and summary.strip():
+                    summaries[repo] = self._wrap_summary(repo, summary.strip())
         except Exception as e:
-            logger.error(f"生成AI总结时出错: {e}")
-            # 返回简单的提交列表作为备用
-            return self._generate_simple_summary(repo, commits)
+            logger.warning(f"批量生成AI总结失败，改为逐个仓库生成: {e}")
+        
+        # 批量结果缺失的仓库逐个生成
+        missing = [repo for repo in repo_to_commits if repo not in summaries]
+        if missing:
+            results = await asyncio.gather(
+                *(self.summarize_commits(repo, repo_to_commits[repo]) for repo in missing)
+            )
+            summaries.update(zip(missing, results))
+        
+        return summaries
+    
+    def _wrap_summary(self, repo: str, summary: str) -> str:
+        """为总结添加仓库标题和链接"""
+        header = f"📊 {repo} 代码更新总结\n" + "="*30 + "\n"
+        footer = f"\n🔗 查看详情：https://github.com/{repo}/commits"
+        return header + summary + footer
     
     def _format_commits_for_ai(self, commits: List[Dict]) -> str:
         """格式化提交记录供AI处理"""
         formatted_commits = []
         
         for commit in commits:
-            commit_info = f"""
-提交SHA: {commit['sha']}
-作者: {commit['author']}
-时间: {commit['date']}
-消息: {commit['message']}
-"""
+            lines = [
+                "",
+                f"提交SHA: {commit['sha']}",
+                f"作者: {commit['author']}",
+                f"时间: {commit['date']}",
+                f"消息: {commit['message']}",
+            ]
             
             # 添加文件变更信息
-            if 'files' in commit and commit['files']:
-                files_info = []
-                for file in commit['files'][:5]:  # 最多显示5个文件
-                    files_info.append(f"  - {file['filename']} ({file['status']})")
-                commit_info += "变更文件:\n" + "\n".join(files_info)
-                
-                if len(commit['files']) > 5:
-                    commit_info += f"\n  ... 还有 {len(commit['files']) - 5} 个文件"
+            files = commit.get('files')
+            if files:
+                lines.append("变更文件:")
+                lines.extend(f"  - {file['filename']} ({file['status']})" for file in files[:5])  # 最多显示5个文件
+                if len(files) > 5:
+                    lines.append(f"  ... 还有 {len(files) - 5} 个文件")
+            else:
+                lines.append("")
             
-            formatted_commits.append(commit_info)
+            formatted_commits.append("\n".join(lines))
         
         return "\n" + "-"*50 + "\n".join(formatted_commits)
     
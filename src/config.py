@@ -4,7 +4,7 @@
 
 import json
 from pathlib import Path
-from typing import List, Union, Dict, Any
+from typing import List
 from pydantic import BaseModel, validator
 
 
@@ -25,23 +25,38 @@ class Config(BaseModel):
     """配置类"""
     
     github_token: str
-    github_repos: List[Union[str, Dict[str, Any]]]  # 支持字符串或字典格式
+    github_repos: List[RepoConfig]  # 配置文件中支持字符串或字典格式，加载时统一规范化
     check_interval: int = 300  # 默认5分钟
+    github_concurrency: int = 10  # 同时进行的GitHub请求数上限
     
     openai_api_key: str
     openai_base_url: str = "https://api.openai.com/v1"
     openai_model: str = "gpt-3.5-turbo"
+    openai_rpm: int = 60  # 每分钟最多发起的AI请求数
     
     qq_bot_url: str
     qq_group_id: str
     
     database_path: str = "data.db"
     
-    def get_repo_configs(self) -> List[RepoConfig]:
+    @property
+    def repo_configs(self) -> List[RepoConfig]:
         """获取规范化的仓库配置列表"""
+        return self.github_repos
+    
+    @validator('github_repos', pre=True)
+    def normalize_repos(cls, v):
+        """将字符串或字典格式的仓库配置规范化为 RepoConfig"""
+        if not v:
+            raise ValueError("github_repos 不能为空")
+        if not isinstance(v, list):
+            raise ValueError(f"github_repos 应为列表: {v}")
+        
         configs = []
-        for item in self.github_repos:
-            if isinstance(item, str):
+        for item in v:
+            if isinstance(item, RepoConfig):
+                configs.append(item)
+            elif isinstance(item, str):
                 # 简单字符串格式，默认监控所有分支
                 configs.append(RepoConfig(repo=item, branches=["*"]))
             elif isinstance(item, dict):
@@ -62,24 +77,18 @@ class Config(BaseModel):
                 raise ValueError(f"不支持的仓库配置格式: {item}")
         return configs
     
-    @validator('github_repos')
-    def validate_repos(cls, v):
-        """验证仓库格式"""
-        if not v:
-            raise ValueError("github_repos 不能为空")
-        
-        for item in v:
-            if isinstance(item, str):
-                if '/' not in item:
-                    raise ValueError(f"仓库格式错误: {item}，应为 owner/repo 格式")
-            elif isinstance(item, dict):
-                repo = item.get('repo')
-                if not repo:
-                    raise ValueError(f"仓库配置缺少 'repo' 字段: {item}")
-                if '/' not in repo:
-                    raise ValueError(f"仓库格式错误: {repo}，应为 owner/repo 格式")
-            else:
-                raise ValueError(f"不支持的仓库配置格式: {item}")
+    @validator('openai_rpm')
+    def validate_openai_rpm(cls, v):
+        """验证AI请求速率"""
+        if v <= 0:
+            raise ValueError("openai_rpm 必须大于0")
+        return v
+    
+    @validator('github_concurrency')
+    def validate_github_concurrency(cls, v):
+        """验证GitHub请求并发数"""
+        if v <= 0:
+            raise ValueError("github_concurrency 必须大于0")
         return v
     
     @validator('check_interval')
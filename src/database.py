@@ -3,9 +3,11 @@
 """
 
 import sqlite3
+import threading
 from datetime import datetime, timezone
-from typing import Optional, Dict
+from typing import Optional, Dict, List, Tuple
 from pathlib import Path
+import orjson
 from loguru import logger
 
 
@@ -14,45 +16,107 @@ class Database:
     
     def __init__(self, db_path: str = "data.db"):
         self.db_path = db_path
+        self._conn: Optional[sqlite3.Connection] = None
+        # 单个长连接在并发任务间共享，用锁串行化访问
+        self._lock = threading.Lock()
         self._init_db()
     
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+    
     def _init_db(self):
         """初始化数据库表"""
         try:
             # 确保数据库目录存在
             Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
+            # 自动提交模式 + WAL：读不阻塞写，写入只需追加日志
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA temp_store=MEMORY")
+            
+            with self._lock:
+                self._conn.execute("""
                     CREATE TABLE IF NOT EXISTS repo_checks (
                         repo TEXT PRIMARY KEY,
                         last_check_time TEXT,
                         last_commit_sha TEXT,
+                        etag TEXT,
                         created_at TEXT DEFAULT CURRENT_TIMESTAMP,
                         updated_at TEXT DEFAULT CURRENT_TIMESTAMP
                     )
                 """)
-                conn.commit()
+                # 兼容旧版本数据库：补充etag列
+                columns = [row[1] for row in self._conn.execute("PRAGMA table_info(repo_checks)")]
+                if "etag" not in columns:
+                    self._conn.execute("ALTER TABLE repo_checks ADD COLUMN etag TEXT")
+                # 提交详情缓存：提交内容由SHA唯一确定且不可变，命中即可直接使用
+                self._conn.execute("""
+                    CREATE TABLE IF NOT EXISTS commit_cache (
+                        sha TEXT PRIMARY KEY,
+                        payload BLOB
+                    )
+                """)
                 logger.info(f"数据库初始化完成: {self.db_path}")
         except Exception as e:
             logger.error(f"初始化数据库失败: {e}")
             raise
     
+    @staticmethod
+    def _parse_time(value: str) -> datetime:
+        """解析时间并确保是UTC时区"""
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt
+    
+    def get_states(self, repos: List[str]) -> Dict[str, Tuple[Optional[datetime], Optional[str], Optional[str]]]:
+        """一次查询获取多个仓库的检查状态
+        
+        Returns:
+            仓库 -> (最后检查时间, 最后提交SHA, ETag)，没有记录的仓库为 (None, None, None)
+        """
+        states: Dict[str, Tuple[Optional[datetime], Optional[str], Optional[str]]] = {
+            repo: (None, None, None) for repo in repos
+        }
+        if not repos:
+            return states
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    f"SELECT repo, last_check_time, last_commit_sha, etag FROM repo_checks "
+                    f"WHERE repo IN ({','.join('?' * len(repos))})",
+                    tuple(repos)
+                )
+                rows = cursor.fetchall()
+            
+            for repo, last_check_time, last_commit_sha, etag in rows:
+                states[repo] = (
+                    self._parse_time(last_check_time) if last_check_time else None,
+                    last_commit_sha or None,
+                    etag or None
+                )
+        except Exception as e:
+            logger.error(f"批量获取仓库状态失败: {e}")
+        return states
+    
     def get_last_check_time(self, repo: str) -> Optional[datetime]:
         """获取指定仓库的最后检查时间"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
+            with self._lock:
+                cursor = self._conn.execute(
                     "SELECT last_check_time FROM repo_checks WHERE repo = ?",
                     (repo,)
                 )
                 result = cursor.fetchone()
                 
                 if result and result[0]:
-                    # 解析时间并确保是UTC时区
-                    dt = datetime.fromisoformat(result[0])
-                    if dt.tzinfo is None:
-                        dt = dt.replace(tzinfo=timezone.utc)
+                    dt = self._parse_time(result[0])
                     logger.info(f"获取到仓库 {repo} 的最后检查时间: {dt}")
                     return dt
                     
@@ -72,8 +136,9 @@ class Database:
             check_time_str = check_time.isoformat()
             current_time = datetime.now(timezone.utc).isoformat()
             
-            with sqlite3.connect(self.db_path) as conn:
-                conn.execute("""
+            # 检查状态变化后旧的ETag不再可信，这里会一并清空etag
+            with self._lock:
+                self._conn.execute("""
                     INSERT OR REPLACE INTO repo_checks 
                     (repo, last_check_time, last_commit_sha, created_at, updated_at) 
                     VALUES (?, ?, ?, 
@@ -81,7 +146,6 @@ class Database:
                         ?
                     )
                 """, (repo, check_time_str, last_commit_sha, repo, current_time, current_time))
-                conn.commit()
                 
                 logger.info(f"更新仓库 {repo} 检查状态 - 时间: {check_time_str}, SHA: {last_commit_sha[:7] if last_commit_sha else 'None'}")
         except Exception as e:
@@ -90,8 +154,8 @@ class Database:
     def get_last_commit_sha(self, repo: str) -> Optional[str]:
         """获取最后处理的提交SHA"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
+            with self._lock:
+                cursor = self._conn.execute(
                     "SELECT last_commit_sha FROM repo_checks WHERE repo = ?",
                     (repo,)
                 )
@@ -103,11 +167,38 @@ class Database:
             logger.error(f"获取最后提交SHA失败: {e}")
             return None
     
+    def get_etag(self, repo: str) -> Optional[str]:
+        """获取仓库比较接口请求的ETag"""
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "SELECT etag FROM repo_checks WHERE repo = ?",
+                    (repo,)
+                )
+                result = cursor.fetchone()
+                return result[0] if result and result[0] else None
+        except Exception as e:
+            logger.error(f"获取ETag失败: {e}")
+            return None
+    
+    def update_etag(self, repo: str, etag: Optional[str]):
+        """更新仓库比较接口请求的ETag"""
+        try:
+            current_time = datetime.now(timezone.utc).isoformat()
+            with self._lock:
+                self._conn.execute("""
+                    INSERT INTO repo_checks (repo, etag, created_at, updated_at)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(repo) DO UPDATE SET etag = excluded.etag
+                """, (repo, etag, current_time, current_time))
+        except Exception as e:
+            logger.error(f"更新ETag失败: {e}")
+    
     def get_repo_status(self, repo: str) -> Dict:
         """获取仓库的完整状态信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.execute(
+            with self._lock:
+                cursor = self._conn.execute(
                     "SELECT last_check_time, last_commit_sha, created_at, updated_at FROM repo_checks WHERE repo = ?",
                     (repo,)
                 )
@@ -125,4 +216,29 @@ class Database:
                     return {"repo": repo, "status": "new"}
         except Exception as e:
             logger.error(f"获取仓库状态失败: {e}")
-            return {"repo": repo, "error": str(e)} 
\ No newline at end of file
+            return {"repo": repo, "error": str(e)} 
+    
+    def get_commit(self, sha: str) -> Optional[Dict]:
+        """从缓存获取已格式化的提交详情"""
+        try:
+            with self._lock:
+                cursor = self._conn.execute(
+                    "SELECT payload FROM commit_cache WHERE sha = ?",
+                    (sha,)
+                )
+                result = cursor.fetchone()
+                return orjson.loads(result[0]) if result and result[0] else None
+        except Exception as e:
+            logger.error(f"读取提交缓存失败: {e}")
+            return None
+    
+    def put_commit(self, sha: str, commit: Dict):
+        """缓存已格式化的提交详情"""
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO commit_cache (sha, payload) VALUES (?, ?)",
+                    (sha, orjson.dumps(commit))
+                )
+        except Exception as e:
+            logger.error(f"写入提交缓存失败: {e}")
@@ -2,26 +2,176 @@
 GitHub监控模块 - 获取仓库提交信息
 """
 
+import asyncio
+import json
+import ssl
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import time
 import aiohttp
+import orjson
 from datetime import datetime, timezone
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple, AsyncIterator, Set
 from loguru import logger
 
+from .database import Database
+from .rate_limiter import AsyncLeakyBucket
+
+try:
+    # C实现的RFC 3339解析，比 datetime.fromisoformat 快得多
+    from ciso8601 import parse_rfc3339
+except ImportError:
+    parse_rfc3339 = None
+
+# 触发频率限制（403/429）后的最大重试次数
+_MAX_RETRIES = 3
+# 每次检查最多处理的新提交数量（与提交列表接口的每页数量一致）
+_MAX_NEW_COMMITS = 30
+# 内存中缓存的提交详情数量上限
+_COMMIT_CACHE_SIZE = 2048
+
+
+def _parse_commit_date(value: str) -> datetime:
+    """解析GitHub GraphQL返回的提交时间（带时区偏移）"""
+    if parse_rfc3339 is not None:
+        try:
+            return parse_rfc3339(value)
+        except ValueError:
+            pass
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
 
 class GitHubMonitor:
     """GitHub仓库监控器"""
     
-    def __init__(self, token: str):
+    def __init__(self, token: str, db: Optional[Database] = None,
+                 rate_limiter: Optional[AsyncLeakyBucket] = None, concurrency: int = 10):
         self.token = token
+        self.db = db  # 可选，用于缓存提交详情
+        self.rate_limiter = rate_limiter  # 可选，主动限制请求速率
         self.base_url = "https://api.github.com"
         self.headers = {
             "Authorization": f"token {token}",
             "Accept": "application/vnd.github.v3+json",
             "User-Agent": "GitHub-QQ-Bot/1.0"
         }
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 校验证书的SSL上下文，会话重建后仍复用，可以利用TLS会话恢复减少握手
+        self._ssl_ctx = ssl.create_default_context()
+        # 限制同时进行的GitHub请求数量，避免触发GitHub二级频率限制
+        self.concurrency = concurrency
+        self._sem = asyncio.Semaphore(concurrency)
+        # 配额耗尽时记录的重置时间（Unix时间戳），此前的请求需要等待
+        self._rate_reset_at: Optional[float] = None
+        # 提交详情的内存LRU缓存: 完整SHA -> 格式化后的提交，位于数据库缓存之前
+        self._commit_cache: "OrderedDict[str, Dict]" = OrderedDict()
+        # 多分支仓库各分支提交列表的ETag: (repo, branch) -> ETag，规则与数据库中的ETag相同
+        self._etags: Dict[Tuple[str, Optional[str]], str] = {}
+        # 最近提交的条件请求缓存: (repo, limit, branch) -> (ETag, 提交列表)
+        self._recent_cache: Dict[Tuple[str, int, Optional[str]], Tuple[str, List[Dict]]] = {}
+        # 分支最新SHA的条件请求缓存: (repo, branch) -> (ETag, SHA)
+        self._head_cache: Dict[Tuple[str, str], Tuple[str, str]] = {}
+    
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话（首次使用时创建），复用TCP/TLS连接"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                headers=self.headers,
+                json_serialize=lambda obj: orjson.dumps(obj).decode(),
+                # 同时进行的请求不超过concurrency，连接数与之一致即可，多余的连接只会增加TLS握手
+                connector=aiohttp.TCPConnector(ssl=self._ssl_ctx, limit=32, limit_per_host=self.concurrency,
+                                               ttl_dns_cache=300)
+            )
+        return self._session
+    
+    async def close(self):
+        """关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+        # 信号量会绑定到使用它的事件循环，关闭会话时一并重建
+        self._sem = asyncio.Semaphore(self.concurrency)
+    
+    async def _throttle(self):
+        """请求前等待限流令牌"""
+        if self.rate_limiter:
+            await self.rate_limiter.acquire()
+    
+    async def _respect_rate_limit(self):
+        """配额已耗尽时等待到重置时间"""
+        if self._rate_reset_at is None:
+            return
+        delay = self._rate_reset_at - time.time()
+        if delay > 0:
+            logger.warning(f"GitHub API配额已耗尽，等待 {delay:.0f} 秒后继续请求")
+            await asyncio.sleep(delay)
+        self._rate_reset_at = None
+    
+    @asynccontextmanager
+    async def _request(self, method: str, url: str, observe_rate_limit: bool = True,
+                       **kwargs) -> AsyncIterator[aiohttp.ClientResponse]:
+        """发送GitHub请求：占用并发名额并等待限流令牌，收到响应后调整请求速率
+        
+        遇到频率限制（403/429）时按 Retry-After 或配额重置时间等待后重试，
+        没有这些响应头的429按指数退避重试；重试次数用完后把最后的响应交给调用方。
+        observe_rate_limit为False时不根据响应头调整REST请求的速率和等待时间。
+        """
+        session = await self._ensure_session()
+        async with self._sem:
+            for attempt in range(_MAX_RETRIES + 1):
+                await self._respect_rate_limit()
+                await self._throttle()
+                response = await session.request(method, url, **kwargs)
+                if observe_rate_limit:
+                    self._observe_rate_limit(response)
+                delay = self._retry_delay(response, attempt)
+                if delay is None or attempt == _MAX_RETRIES:
+                    break
+                response.release()
+                logger.warning(f"GitHub API频率限制 ({response.status})，等待后第 {attempt + 1} 次重试")
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            
+            async with response:
+                yield response
+    
+    def _retry_delay(self, response: aiohttp.ClientResponse, attempt: int) -> Optional[float]:
+        """计算频率限制响应的重试等待时间（秒），不需要重试时返回None"""
+        if response.status not in (403, 429):
+            return None
+        retry_after = response.headers.get("Retry-After")
+        if retry_after is not None:
+            try:
+                return max(float(retry_after), 2.0 ** attempt)
+            except ValueError:
+                pass
+        if self._rate_reset_at is not None:
+            # 主要配额耗尽，由 _respect_rate_limit 等待到重置时间
+            return 0.0
+        if response.status == 429:
+            return 2.0 ** attempt
+        return None  # 没有频率限制相关响应头的403是权限问题，重试无意义
+    
+    def _observe_rate_limit(self, response: aiohttp.ClientResponse):
+        """记录配额耗尽时的重置时间，并根据剩余配额动态调低请求速率"""
+        remaining = response.headers.get("X-RateLimit-Remaining")
+        reset = response.headers.get("X-RateLimit-Reset")
+        if remaining is None or reset is None:
+            return
+        try:
+            remaining_count = int(remaining)
+            reset_at = int(reset)
+        except ValueError:
+            return
+        if remaining_count == 0:
+            self._rate_reset_at = reset_at + 1.0  # 多等1秒，避免时钟误差
+        if self.rate_limiter:
+            seconds_left = max(1.0, reset_at - time.time())
+            # 剩余配额平均分配到重置前的时间里
+            self.rate_limiter.retune(max(remaining_count, 1) / seconds_left)
     
     async def get_new_commits(self, repo: str, since: Optional[datetime] = None, last_commit_sha: Optional[str] = None, branches: Optional[List[str]] = None) -> List[Dict]:
-        """获取指定时间之后的新提交
+        """获取指定时间之后的新提交（包含文件变更）
         
         Args:
             repo: 仓库名称 (owner/repo)
@@ -29,6 +179,16 @@ class GitHubMonitor:
             last_commit_sha: 上次处理的提交SHA
             branches: 要监控的分支列表，None或["*"]表示所有分支
         """
+        commits = await self.list_new_commits_lite(repo, since, last_commit_sha, branches)
+        return await self.hydrate_files(repo, commits)
+    
+    async def list_new_commits_lite(self, repo: str, since: Optional[datetime] = None, last_commit_sha: Optional[str] = None, branches: Optional[List[str]] = None,
+                                    etag: Optional[str] = None) -> List[Dict]:
+        """获取指定时间之后的新提交，只使用提交列表接口的数据（不含文件变更）
+        
+        参数同 get_new_commits，需要文件变更时再调用 hydrate_files。
+        etag为调用方已读取的比较接口ETag，未提供时从数据库读取。
+        """
         # 如果没有指定分支或指定了"*"，则获取所有分支
         if not branches or "*" in branches:
             branches = None  # GitHub API 默认返回所有分支
@@ -36,30 +196,120 @@ class GitHubMonitor:
         all_commits = []
         
         # 如果指定了特定分支，分别获取每个分支的提交
-        if branches:
-            for branch in branches:
-                logger.info(f"获取 {repo} 分支 {branch} 的提交")
-                branch_commits = await self._get_branch_commits(repo, branch, since, last_commit_sha)
-                all_commits.extend(branch_commits)
+        if branches and len(branches) > 1:
+            logger.info(f"并发获取 {repo} 分支 {', '.join(branches)} 的提交")
+            # 同一个提交可能在多个分支上，各分支共享已见过的SHA，在格式化之前去重
+            seen_shas: Set[str] = set()
+            branch_results = await asyncio.gather(
+                *(self._get_new_branch_commits(repo, branch, since, last_commit_sha, seen_shas) for branch in branches)
+            )
+            all_commits = [commit for branch_commits in branch_results for commit in branch_commits]
         else:
-            # 获取所有分支的提交（默认行为）
-            logger.info(f"获取 {repo} 所有分支的提交")
-            all_commits = await self._get_branch_commits(repo, None, since, last_commit_sha)
-        
-        # 去重（同一个提交可能在多个分支上）
-        seen_shas = set()
-        unique_commits = []
-        for commit in all_commits:
-            if commit["full_sha"] not in seen_shas:
-                seen_shas.add(commit["full_sha"])
-                unique_commits.append(commit)
-        
-        return unique_commits[::-1]  # 按时间顺序排序（最早的在前）
-    
-    async def _get_branch_commits(self, repo: str, branch: Optional[str], since: Optional[datetime], last_commit_sha: Optional[str]) -> List[Dict]:
-        """获取指定分支的提交"""
+            branch = branches[0] if branches else None
+            if branch:
+                logger.info(f"获取 {repo} 分支 {branch} 的提交")
+            else:
+                # 获取所有分支的提交（默认行为）
+                logger.info(f"获取 {repo} 所有分支的提交")
+            if last_commit_sha:
+                # 有上次处理的SHA时，一次比较请求即可取得之后的全部提交。
+                # 数据库中的ETag只属于比较接口，只在没有新提交时保存，因此也只在有SHA时使用
+                if self.db is not None and etag is None:
+                    etag = self.db.get_etag(repo)
+                compared = await self._get_compare_commits(repo, last_commit_sha, branch or "HEAD",
+                                                           etag=etag, store_etag=self.db is not None)
+                if compared is not None:
+                    return compared
+            # 比较接口不可用时回退到提交列表，不发送比较接口的ETag
+            all_commits = await self._get_branch_commits(repo, branch, since, last_commit_sha)
+        
+        if branches and len(branches) > 1:
+            # 多个分支的结果拼接后不再有序，按提交时间排序（UTC的ISO时间可直接按字符串比较）。
+            # 单个分支保留接口的拓扑顺序，保证最后一个就是分支最新的提交
+            all_commits.sort(key=lambda commit: commit["date"])
+        
+        return all_commits  # 按时间顺序排列（最早的在前）
+    
+    async def _get_new_branch_commits(self, repo: str, branch: str, since: Optional[datetime],
+                                      last_commit_sha: Optional[str], seen_shas: Set[str]) -> List[Dict]:
+        """获取多分支仓库中单个分支的新提交，分支最新SHA就是上次处理的提交时不再请求列表"""
+        if last_commit_sha and await self.head_sha(repo, branch) == last_commit_sha:
+            logger.info(f"{repo} 分支 {branch} 没有新提交")
+            return []
+        return await self._get_branch_commits(repo, branch, since, last_commit_sha,
+                                              etag=self._etags.get((repo, branch)), seen_shas=seen_shas)
+    
+    async def _get_compare_commits(self, repo: str, base: str, head: str,
+                                   etag: Optional[str] = None, store_etag: bool = False) -> Optional[List[Dict]]:
+        """通过比较接口获取base之后直到head的提交（按时间顺序，最早的在前）
+        
+        只有head领先于或等同于base时结果可用；分叉、落后或请求失败时返回None，
+        调用方应回退到提交列表接口。只有一个新提交时，比较结果中的文件变更就是
+        该提交的变更，直接写入缓存，省去一次详情请求。ETag规则同 _get_branch_commits。
+        """
+        url = f"{self.base_url}/repos/{repo}/compare/{base}...{head}"
+        headers = {"If-None-Match": etag} if etag else None  # 默认请求头已设置在会话上
+        
+        try:
+            async with self._request("GET", url, headers=headers) as response:
+                if response.status == 304:
+                    logger.info(f"{repo} 提交比较结果未变化 (304)")
+                    return []
+                if response.status != 200:
+                    logger.info(f"{repo} 比较 {base[:7]}...{head} 失败: {response.status}，回退到提交列表接口")
+                    return None
+                payload = orjson.loads(await response.read())
+                response_etag = response.headers.get("ETag")
+        except Exception as e:
+            logger.warning(f"{repo} 比较 {base[:7]}...{head} 时出错: {e}，回退到提交列表接口")
+            return None
+        
+        status = payload.get("status")
+        if status == "identical":
+            if store_etag and self.db:
+                self.db.update_etag(repo, response_etag)
+            return []
+        if status != "ahead":
+            logger.info(f"{repo} {head} 相对 {base[:7]} 的状态为 {status}，回退到提交列表接口")
+            return None
+        
+        commits_data = payload.get("commits") or []
+        if len(commits_data) > _MAX_NEW_COMMITS:
+            # 比较接口最多返回250个提交，只保留最新的部分，最后一个仍是head
+            logger.info(f"{repo} 有 {len(commits_data)} 个新提交，只处理最新的 {_MAX_NEW_COMMITS} 个")
+            commits_data = commits_data[-_MAX_NEW_COMMITS:]
+        files = payload.get("files")
+        if len(commits_data) == 1 and files is not None:
+            additions = sum(file.get("additions", 0) for file in files)
+            deletions = sum(file.get("deletions", 0) for file in files)
+            commits_data = [{
+                **commits_data[0],
+                "files": files,
+                "stats": {"additions": additions, "deletions": deletions, "total": additions + deletions}
+            }]
+        
+        formatted_commits = [commit for commit in map(self._format_commit, commits_data) if commit]
+        if len(formatted_commits) == 1 and files is not None:
+            commit = formatted_commits[0]
+            self._remember_commit(commit["full_sha"], commit)
+            if self.db:
+                self.db.put_commit(commit["full_sha"], commit)
+        
+        logger.info(f"通过比较接口获取到 {repo} 的 {len(formatted_commits)} 个新提交")
+        return formatted_commits
+    
+    async def _get_branch_commits(self, repo: str, branch: Optional[str], since: Optional[datetime], last_commit_sha: Optional[str],
+                                  etag: Optional[str] = None,
+                                  seen_shas: Optional[Set[str]] = None) -> List[Dict]:
+        """获取指定分支的提交
+        
+        传入etag时发送条件请求，返回304说明列表未变化，直接返回空列表。
+        没有新提交时把响应ETag按 (repo, branch) 记在内存中；
+        有新提交时不保存，以免消息发送失败后这些提交被304跳过。
+        传入seen_shas时跳过其中已有的提交，并把本分支返回的提交加入其中。
+        """
         url = f"{self.base_url}/repos/{repo}/commits"
-        params: Dict[str, Any] = {"per_page": 30}  # 增加获取数量以确保不遗漏
+        params: Dict[str, Any] = {"per_page": _MAX_NEW_COMMITS}  # 增加获取数量以确保不遗漏
         
         # 添加分支参数
         if branch:
@@ -73,63 +323,135 @@ class GitHubMonitor:
             branch_info = f"分支 {branch}" if branch else "所有分支"
             logger.info(f"获取 {repo} {branch_info} 自 {params['since']} 以来的提交")
         
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=self.headers, params=params, ssl=False) as response:
-                    if response.status == 200:
-                        commits_data = await response.json()
-                        branch_info = f"分支 {branch}" if branch else "所有分支"
-                        logger.info(f"从GitHub API获取到 {len(commits_data)} 个提交 ({branch_info})")
-                        
-                        # 过滤掉已经处理过的提交
-                        if last_commit_sha:
-                            new_commits = []
-                            for commit in commits_data:
-                                if commit["sha"] == last_commit_sha:
-                                    break  # 找到上次处理的提交，停止收集
-                                new_commits.append(commit)
-                            commits_data = new_commits
-                            logger.info(f"过滤后得到 {len(commits_data)} 个新提交")
-                        
-                        # 获取每个提交的详细信息（包括文件变更）
-                        detailed_commits = []
-                        for commit in commits_data:
-                            detailed_commit = await self._get_commit_details(session, repo, commit["sha"])
-                            if detailed_commit:
-                                detailed_commits.append(detailed_commit)
-                        
-                        return detailed_commits
-                    elif response.status == 404:
-                        branch_info = f"或分支 {branch} 不存在" if branch else ""
-                        logger.error(f"仓库不存在或无权限访问: {repo}{branch_info}")
-                        return []
-                    elif response.status == 403:
-                        error_msg = await response.text()
-                        if "rate limit" in error_msg.lower():
-                            logger.error("GitHub API请求频率限制，请稍后重试")
-                        else:
-                            logger.error("GitHub API访问被限制，请检查token权限")
-                        return []
+        headers = {"If-None-Match": etag} if etag else None  # 默认请求头已设置在会话上
+        
+        try:
+            async with self._request("GET", url, headers=headers, params=params) as response:
+                if response.status == 304:
+                    logger.info(f"{repo} 提交列表未变化 (304)")
+                    return []
+                elif response.status == 200:
+                    commits_data = orjson.loads(await response.read())
+                    branch_info = f"分支 {branch}" if branch else "所有分支"
+                    logger.info(f"从GitHub API获取到 {len(commits_data)} 个提交 ({branch_info})")
+                    
+                    # 过滤掉已经处理过的提交：截止到上次处理的提交为止
+                    new_count = len(commits_data)
+                    if last_commit_sha:
+                        new_count = next(
+                            (i for i, commit in enumerate(commits_data) if commit["sha"] == last_commit_sha),
+                            new_count
+                        )
+                        logger.info(f"过滤后得到 {new_count} 个新提交")
+                    
+                    response_etag = response.headers.get("ETag")
+                    if new_count == 0 and response_etag:
+                        self._etags[(repo, branch)] = response_etag
                     else:
-                        error_msg = await response.text()
-                        logger.error(f"GitHub API请求失败: {response.status}, 响应: {error_msg}")
-                        return []
-            except aiohttp.ClientError as e:
-                logger.error(f"网络请求GitHub API时出错: {e}")
-                return []
-            except Exception as e:
-                logger.error(f"请求GitHub API时出错: {e}")
-                return []
-    
-    async def _get_commit_details(self, session: aiohttp.ClientSession, repo: str, commit_sha: str) -> Optional[Dict]:
+                        self._etags.pop((repo, branch), None)
+                    
+                    # 接口按时间倒序返回，反向遍历得到按时间顺序（最早的在前）的结果
+                    indices = range(new_count - 1, -1, -1)
+                    if seen_shas is not None:
+                        indices = [i for i in indices if commits_data[i]["sha"] not in seen_shas]
+                        seen_shas.update(commits_data[i]["sha"] for i in indices)
+                    formatted_commits = (self._format_commit(commits_data[i]) for i in indices)
+                    return [commit for commit in formatted_commits if commit]
+                elif response.status == 404:
+                    branch_info = f"或分支 {branch} 不存在" if branch else ""
+                    logger.error(f"仓库不存在或无权限访问: {repo}{branch_info}")
+                    return []
+                elif response.status in (403, 429):
+                    # 根据响应头判断是否为频率限制（主要配额耗尽或二级限制），无需读取响应体
+                    if response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers:
+                        logger.error("GitHub API请求频率限制，请稍后重试")
+                    else:
+                        logger.error("GitHub API访问被限制，请检查token权限")
+                    return []
+                else:
+                    error_msg = await response.text()
+                    logger.error(f"GitHub API请求失败: {response.status}, 响应: {error_msg}")
+                    return []
+        except aiohttp.ClientError as e:
+            logger.error(f"网络请求GitHub API时出错: {e}")
+            return []
+        except Exception as e:
+            logger.error(f"请求GitHub API时出错: {e}")
+            return []
+    
+    async def head_sha(self, repo: str, branch: str = "HEAD") -> Optional[str]:
+        """获取分支最新提交的SHA，失败时返回None
+        
+        使用 application/vnd.github.sha 媒体类型，响应体只有40字节的SHA。
+        带上次响应的ETag发送条件请求，分支未变化时返回304，不消耗请求配额。
+        """
+        url = f"{self.base_url}/repos/{repo}/commits/{branch}"
+        cache_key = (repo, branch)
+        cached = self._head_cache.get(cache_key)
+        headers = {"Accept": "application/vnd.github.sha"}
+        if cached:
+            headers["If-None-Match"] = cached[0]
+        
+        try:
+            async with self._request("GET", url, headers=headers) as response:
+                if response.status == 304 and cached:
+                    return cached[1]
+                if response.status == 200:
+                    sha = (await response.text()).strip()
+                    etag = response.headers.get("ETag")
+                    if etag:
+                        self._head_cache[cache_key] = (etag, sha)
+                    return sha
+                logger.warning(f"获取 {repo} {branch} 最新提交SHA失败: {response.status}")
+                return None
+        except Exception as e:
+            logger.warning(f"获取 {repo} {branch} 最新提交SHA时出错: {e}")
+            return None
+    
+    async def hydrate_files(self, repo: str, commits: List[Dict], top_k: Optional[int] = None) -> List[Dict]:
+        """为前top_k个提交并发获取详细信息（文件变更和统计），None表示全部
+        
+        获取失败的提交保留原数据，返回列表顺序与输入一致。
+        """
+        count = len(commits) if top_k is None else min(top_k, len(commits))
+        details = await asyncio.gather(
+            *(self._get_commit_details(repo, commit["full_sha"]) for commit in commits[:count]),
+            return_exceptions=True
+        )
+        
+        hydrated = list(commits)
+        for index, detail in enumerate(details):
+            if isinstance(detail, Exception):
+                logger.warning(f"获取提交详情时出错: {detail}")
+            elif detail:
+                hydrated[index] = detail
+        return hydrated
+    
+    async def _get_commit_details(self, repo: str, commit_sha: str) -> Optional[Dict]:
         """获取单个提交的详细信息"""
+        # 提交不可变，缓存命中时无需再请求
+        cached = self._commit_cache.get(commit_sha)
+        if cached:
+            self._commit_cache.move_to_end(commit_sha)
+            return cached
+        if self.db:
+            cached = self.db.get_commit(commit_sha)
+            if cached:
+                self._remember_commit(commit_sha, cached)
+                return cached
+        
         url = f"{self.base_url}/repos/{repo}/commits/{commit_sha}"
         
         try:
-            async with session.get(url, headers=self.headers, ssl=False) as response:
+            async with self._request("GET", url) as response:
                 if response.status == 200:
-                    commit_data = await response.json()
-                    return self._format_commit(commit_data)
+                    commit_data = orjson.loads(await response.read())
+                    formatted_commit = self._format_commit(commit_data)
+                    if formatted_commit:
+                        self._remember_commit(commit_sha, formatted_commit)
+                        if self.db:
+                            self.db.put_commit(commit_sha, formatted_commit)
+                    return formatted_commit
                 else:
                     logger.warning(f"获取提交 {commit_sha[:7]} 详情失败: {response.status}")
                     return None
@@ -137,6 +459,13 @@ class GitHubMonitor:
             logger.warning(f"获取提交 {commit_sha[:7]} 详情时出错: {e}")
             return None
     
+    def _remember_commit(self, commit_sha: str, commit: Dict):
+        """写入内存缓存，超出上限时淘汰最久未使用的提交"""
+        self._commit_cache[commit_sha] = commit
+        self._commit_cache.move_to_end(commit_sha)
+        if len(self._commit_cache) > _COMMIT_CACHE_SIZE:
+            self._commit_cache.popitem(last=False)
+    
     async def get_recent_commits(self, repo: str, limit: int = 5, branch: Optional[str] = None) -> List[Dict]:
         """获取最近的提交（用于测试）
         
@@ -151,70 +480,196 @@ class GitHubMonitor:
         if branch:
             params["sha"] = branch
         
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=self.headers, params=params, ssl=False) as response:
-                    if response.status == 200:
-                        commits_data = await response.json()
-                        
-                        # 获取详细信息
-                        detailed_commits = []
-                        for commit in commits_data:
-                            detailed_commit = await self._get_commit_details(session, repo, commit["sha"])
-                            if detailed_commit:
-                                detailed_commits.append(detailed_commit)
-                        
-                        return detailed_commits
-                    else:
-                        error_msg = await response.text()
-                        logger.error(f"获取提交记录失败: {response.status}, 响应: {error_msg}")
-                        return []
-            except Exception as e:
-                logger.error(f"获取提交记录时出错: {e}")
-                return []
+        cache_key = (repo, limit, branch)
+        cached = self._recent_cache.get(cache_key)
+        headers = {"If-None-Match": cached[0]} if cached else None  # 默认请求头已设置在会话上
+        
+        try:
+            async with self._request("GET", url, headers=headers, params=params) as response:
+                if response.status == 304 and cached:
+                    return cached[1]
+                elif response.status == 200:
+                    commits_data = orjson.loads(await response.read())
+                    etag = response.headers.get("ETag")
+                else:
+                    error_msg = await response.text()
+                    logger.error(f"获取提交记录失败: {response.status}, 响应: {error_msg}")
+                    return []
+            
+            # 释放列表请求占用的并发名额后再获取详细信息
+            formatted_commits = (self._format_commit(commit) for commit in commits_data)
+            detailed_commits = await self.hydrate_files(repo, [commit for commit in formatted_commits if commit])
+            if etag:
+                self._recent_cache[cache_key] = (etag, detailed_commits)
+            return detailed_commits
+        except Exception as e:
+            logger.error(f"获取提交记录时出错: {e}")
+            return []
+    
+    async def fetch_bulk_commits(self, repo_configs: List[Any], since_map: Dict[str, Optional[datetime]],
+                                 sha_map: Optional[Dict[str, Optional[str]]] = None) -> Dict[str, List[Dict]]:
+        """通过一次GraphQL请求获取多个仓库的新提交
+        
+        Args:
+            repo_configs: 仓库配置列表（RepoConfig）
+            since_map: 仓库 -> 起始时间
+            sha_map: 仓库 -> 上次处理的提交SHA
+        
+        Returns:
+            仓库 -> 新提交列表（按时间顺序，最早的在前）。只包含成功获取的仓库，
+            请求失败、仓库或分支不存在的仓库不在结果中，调用方应回退到REST接口。
+        """
+        # GraphQL接口必须认证
+        if not self.token or not repo_configs:
+            return {}
+        sha_map = sha_map or {}
+        
+        selections = []
+        aliases: Dict[str, Tuple[str, List[str]]] = {}
+        for i, repo_config in enumerate(repo_configs):
+            owner, name = repo_config.repo.split("/", 1)
+            since = since_map.get(repo_config.repo)
+            history_args = "first: 30"
+            if since:
+                if since.tzinfo is None:
+                    since = since.replace(tzinfo=timezone.utc)
+                history_args += f", since: {json.dumps(since.strftime('%Y-%m-%dT%H:%M:%SZ'))}"
+            
+            # "*" 与REST接口一致，对应默认分支
+            branches = repo_config.branches
+            if not branches or "*" in branches:
+                refs = ["defaultBranchRef"]
+            else:
+                refs = [f"ref(qualifiedName: {json.dumps('refs/heads/' + branch)})" for branch in branches]
+            
+            ref_aliases = [f"b{j}" for j in range(len(refs))]
+            ref_selections = " ".join(
+                f"{alias}: {ref} {{ target {{ ... on Commit {{ history({history_args}) {{ nodes {{ "
+                f"oid message url additions deletions author {{ name email date }} }} }} }} }} }}"
+                for alias, ref in zip(ref_aliases, refs)
+            )
+            repo_alias = f"r{i}"
+            aliases[repo_alias] = (repo_config.repo, ref_aliases)
+            selections.append(
+                f"{repo_alias}: repository(owner: {json.dumps(owner)}, name: {json.dumps(name)}) {{ {ref_selections} }}"
+            )
+        
+        query = "query { " + " ".join(selections) + " }"
+        
+        try:
+            # GraphQL的X-RateLimit-*响应头描述的是独立的GraphQL点数配额，不用于调整REST请求速率
+            async with self._request("POST", f"{self.base_url}/graphql", observe_rate_limit=False,
+                                     json={"query": query}) as response:
+                if response.status != 200:
+                    logger.warning(f"GraphQL批量获取提交失败: {response.status}，回退到REST接口")
+                    return {}
+                payload = orjson.loads(await response.read())
+        except Exception as e:
+            logger.warning(f"GraphQL批量获取提交时出错: {e}，回退到REST接口")
+            return {}
+        
+        data = payload.get("data") or {}
+        if payload.get("errors"):
+            logger.warning(f"GraphQL返回错误: {payload['errors']}")
+        
+        results: Dict[str, List[Dict]] = {}
+        for repo_alias, (repo, ref_aliases) in aliases.items():
+            repo_data = data.get(repo_alias)
+            if not repo_data or any(not repo_data.get(alias) for alias in ref_aliases):
+                continue  # 仓库或分支不存在，交给REST接口处理并输出具体错误
+            
+            last_commit_sha = sha_map.get(repo)
+            seen_shas = set()
+            repo_commits = []
+            for alias in ref_aliases:
+                nodes = repo_data[alias]["target"]["history"]["nodes"]
+                for node in nodes:
+                    if node["oid"] == last_commit_sha:
+                        break  # 找到上次处理的提交，停止收集
+                    if node["oid"] not in seen_shas:
+                        seen_shas.add(node["oid"])
+                        formatted_commit = self._format_graphql_commit(node)
+                        if formatted_commit:
+                            repo_commits.append(formatted_commit)
+            
+            # GraphQL只返回变更统计，不返回文件变更，需要时由调用方通过 hydrate_files 补充
+            repo_commits.reverse()  # 按时间顺序排序（最早的在前）
+            if len(ref_aliases) > 1:
+                repo_commits.sort(key=lambda commit: commit["date"])  # 多个分支拼接后按提交时间排序
+            results[repo] = repo_commits
+        
+        logger.info(f"GraphQL批量获取 {len(results)}/{len(repo_configs)} 个仓库的提交")
+        return results
     
     def _format_commit(self, commit_data: Dict) -> Dict:
         """格式化单个提交数据"""
         try:
-            # 解析提交时间并转换为UTC
-            commit_date = commit_data["commit"]["author"]["date"]
-            parsed_date = datetime.fromisoformat(commit_date.replace('Z', '+00:00'))
+            sha = commit_data["sha"]
+            commit = commit_data["commit"]
+            author = commit["author"]
+            stats = commit_data.get("stats") or {}
+            files = commit_data.get("files") or ()
             
-            formatted_commit = {
-                "sha": commit_data["sha"][:7],  # 短SHA
-                "full_sha": commit_data["sha"],
-                "message": commit_data["commit"]["message"].strip(),
-                "author": commit_data["commit"]["author"]["name"],
-                "author_email": commit_data["commit"]["author"]["email"],
-                "date": parsed_date.isoformat(),
+            return {
+                "sha": sha[:7],  # 短SHA
+                "full_sha": sha,
+                "message": commit["message"].strip(),
+                "author": author["name"],
+                "author_email": author["email"],
+                "date": author["date"],  # REST接口返回的就是UTC时间，原样保存
                 "url": commit_data["html_url"],
                 "stats": {
-                    "additions": commit_data.get("stats", {}).get("additions", 0),
-                    "deletions": commit_data.get("stats", {}).get("deletions", 0),
-                    "total": commit_data.get("stats", {}).get("total", 0)
-                }
-            }
-            
-            # 解析提交文件变更
-            if "files" in commit_data and commit_data["files"]:
-                formatted_commit["files"] = [
+                    "additions": stats.get("additions", 0),
+                    "deletions": stats.get("deletions", 0),
+                    "total": stats.get("total", 0)
+                },
+                # 解析提交文件变更，status: added, modified, removed
+                "files": [
                     {
                         "filename": file["filename"],
-                        "status": file["status"],  # added, modified, removed
+                        "status": file["status"],
                         "additions": file.get("additions", 0),
                         "deletions": file.get("deletions", 0),
                         "changes": file.get("changes", 0)
                     }
-                    for file in commit_data["files"]
+                    for file in files
                 ]
-            else:
-                formatted_commit["files"] = []
-            
-            return formatted_commit
+            }
             
         except KeyError as e:
             logger.warning(f"提交数据格式异常，缺少字段: {e}")
             return {}
         except Exception as e:
             logger.warning(f"格式化提交数据时出错: {e}")
-            return {} 
\ No newline at end of file
+            return {} 
+    
+    def _format_graphql_commit(self, node: Dict) -> Dict:
+        """格式化GraphQL返回的提交节点（与 _format_commit 结构一致，包含变更统计，不含文件变更）"""
+        try:
+            author = node.get("author") or {}
+            # GraphQL返回提交者本地时区的时间，转换为与REST接口一致的UTC格式
+            parsed_date = _parse_commit_date(author.get("date") or "").astimezone(timezone.utc)
+            additions = node.get("additions") or 0
+            deletions = node.get("deletions") or 0
+            
+            return {
+                "sha": node["oid"][:7],  # 短SHA
+                "full_sha": node["oid"],
+                "message": node["message"].strip(),
+                "author": author.get("name", ""),
+                "author_email": author.get("email", ""),
+                "date": parsed_date.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                "url": node["url"],
+                "stats": {
+                    "additions": additions,
+                    "deletions": deletions,
+                    "total": additions + deletions
+                },
+                "files": []
+            }
+        except KeyError as e:
+            logger.warning(f"GraphQL提交数据格式异常，缺少字段: {e}")
+            return {}
+        except Exception as e:
+            logger.warning(f"格式化GraphQL提交数据时出错: {e}")
+            return {}
@@ -22,6 +22,20 @@ class QQBot:
         
         if token:
             self.headers["Authorization"] = f"Bearer {token}"
+        
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    async def _ensure_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话（首次使用时创建），在多次发送间复用连接"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(headers=self.headers)
+        return self._session
+    
+    async def close(self):
+        """关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def send_message(self, message: str) -> bool:
         """发送消息到QQ群"""
@@ -34,21 +48,21 @@ class QQBot:
                 "message": message
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if result.get("status") == "ok":
-                            logger.info("✅ 消息发送成功")
-                            return True
-                        else:
-                            logger.error(f"QQ机器人返回错误: {result}")
-                            return False
+            session = await self._ensure_session()
+            async with session.post(url, json=payload) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    if result.get("status") == "ok":
+                        logger.info("✅ 消息发送成功")
+                        return True
                     else:
-                        logger.error(f"发送消息失败，HTTP状态码: {response.status}")
-                        response_text = await response.text()
-                        logger.error(f"响应内容: {response_text}")
+                        logger.error(f"QQ机器人返回错误: {result}")
                         return False
+                else:
+                    logger.error(f"发送消息失败，HTTP状态码: {response.status}")
+                    response_text = await response.text()
+                    logger.error(f"响应内容: {response_text}")
+                    return False
                         
         except Exception as e:
             logger.error(f"发送QQ消息时出错: {e}")
@@ -64,19 +78,19 @@ class QQBot:
                 "message": message
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, headers=self.headers, json=payload) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        if result.get("status") == "ok":
-                            logger.info("✅ 私聊消息发送成功")
-                            return True
-                        else:
-                            logger.error(f"QQ机器人返回错误: {result}")
-                            return False
+            session = await self._ensure_session()
+            async with session.post(url, json=payload) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    if result.get("status") == "ok":
+                        logger.info("✅ 私聊消息发送成功")
+                        return True
                     else:
-                        logger.error(f"发送私聊消息失败，HTTP状态码: {response.status}")
+                        logger.error(f"QQ机器人返回错误: {result}")
                         return False
+                else:
+                    logger.error(f"发送私聊消息失败，HTTP状态码: {response.status}")
+                    return False
                         
         except Exception as e:
             logger.error(f"发送QQ私聊消息时出错: {e}")
@@ -87,15 +101,15 @@ class QQBot:
         try:
             url = f"{self.bot_url}/get_status"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=self.headers) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        logger.info(f"QQ机器人状态: {result}")
-                        return True
-                    else:
-                        logger.error(f"QQ机器人连接失败: {response.status}")
-                        return False
+            session = await self._ensure_session()
+            async with session.get(url) as response:
+                if response.status == 200:
+                    result = await response.json()
+                    logger.info(f"QQ机器人状态: {result}")
+                    return True
+                else:
+                    logger.error(f"QQ机器人连接失败: {response.status}")
+                    return False
                         
         except Exception as e:
             logger.error(f"测试QQ机器人连接时出错: {e}")
@@ -0,0 +1,44 @@
+"""
+限流模块 - 异步令牌桶，主动控制API请求速率
+"""
+
+import asyncio
+import time
+
+
+class AsyncLeakyBucket:
+    """异步令牌桶限流器
+
+    令牌按 rate_per_sec 的速度持续补充，最多累积 capacity 个；
+    每次请求前调用 acquire() 取走一个令牌，不足时等待补充。
+    不持有任何事件循环相关的对象，可在多个事件循环中复用。
+    """
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        if rate_per_sec <= 0 or capacity <= 0:
+            raise ValueError("rate_per_sec 和 capacity 必须大于0")
+        self.base_rate = rate_per_sec  # 配置的速率，动态调整时不会超过它
+        self.rate = rate_per_sec
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated_at = time.monotonic()
+
+    def _refill(self):
+        """按经过的时间补充令牌"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    async def acquire(self, tokens: float = 1):
+        """获取令牌，不足时等待"""
+        while True:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def retune(self, rate_per_sec: float):
+        """动态调整速率（不超过配置的速率）"""
+        self._refill()
+        self.rate = min(self.base_rate, max(rate_per_sec, 1e-3))
@@ -18,9 +18,17 @@ async def diagnose_repo(config_path: str, repo: str):
     config = Config.from_file(config_path)
     
     # 初始化组件
-    github_monitor = GitHubMonitor(config.github_token)
     db = Database(config.database_path)
+    github_monitor = GitHubMonitor(config.github_token, db)
     
+    try:
+        await _diagnose(config, repo, github_monitor, db)
+    finally:
+        await github_monitor.close()
+
+
+async def _diagnose(config: Config, repo: str, github_monitor: GitHubMonitor, db: Database):
+    """执行诊断步骤"""
     print(f"🔍 诊断仓库: {repo}")
     print("=" * 60)
     
@@ -46,7 +54,7 @@ async def diagnose_repo(config_path: str, repo: str):
         return
     
     # 查找对应的仓库配置
-    repo_configs = config.get_repo_configs()
+    repo_configs = config.repo_configs
     repo_config = None
     for rc in repo_configs:
         if rc.repo == repo:
@@ -80,11 +88,15 @@ async def diagnose_repo(config_path: str, repo: str):
         print(f"  最后检查时间: {last_check}")
         print(f"  当前UTC时间: {datetime.now(timezone.utc)}")
         
-        # 检查最近几小时是否有提交
-        for hours in [1, 6, 24]:
-            since_time = datetime.now(timezone.utc) - timedelta(hours=hours)
-            commits = await github_monitor.get_new_commits(repo, since_time)
-            print(f"  最近{hours}小时内提交数: {len(commits) if commits else 0}")
+        # 只请求一次最近24小时的提交，1小时和6小时的数量按提交时间在本地统计
+        windows = [1, 6, 24]
+        now = datetime.now(timezone.utc)
+        commits = await github_monitor.list_new_commits_lite(repo, now - timedelta(hours=max(windows)))
+        for hours in windows:
+            # 提交时间都是UTC的 '...Z' 格式，可以直接按字符串比较
+            start = (now - timedelta(hours=hours)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            count = sum(1 for commit in commits if commit['date'] >= start)
+            print(f"  最近{hours}小时内提交数: {count}")
     else:
         print("  这是首次检查，没有历史记录")
     
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+测试AI批量总结功能
+"""
+import asyncio
+import json
+import sys
+from types import SimpleNamespace
+sys.path.append("..")
+
+import src.ai_summarizer as ai_summarizer
+from src.ai_summarizer import AISummarizer
+
+
+class FakeStream:
+    """模拟流式响应"""
+
+    def __init__(self, parts):
+        self.parts = list(parts)
+        self.response = SimpleNamespace(aclose=self._aclose)
+
+    async def _aclose(self):
+        pass
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.parts:
+            raise StopAsyncIteration
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.parts.pop(0)))])
+
+
+class FakeCompletions:
+    """模拟 chat.completions：批量请求返回batch_content(调用参数)，流式请求返回单仓库总结"""
+
+    def __init__(self, batch_content):
+        self.batch_content = batch_content
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if kwargs.get("stream"):
+            return FakeStream(["单独总结"])
+        content = self.batch_content(kwargs)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def make_summarizer(monkeypatch, batch_content):
+    """创建使用模拟客户端的总结器"""
+    completions = FakeCompletions(batch_content)
+    client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    monkeypatch.setattr(ai_summarizer.openai, "AsyncOpenAI", lambda **kwargs: client)
+    return AISummarizer("test_key"), completions
+
+
+def make_commits(repo):
+    return [{"sha": "abcdef1", "author": "a", "date": "2024-01-01T00:00:00Z", "message": f"{repo} 提交", "files": []}]
+
+
+def batch_calls(completions):
+    return [call for call in completions.calls if not call.get("stream")]
+
+
+def test_summarize_many_parses_json(monkeypatch):
+    """批量结果按仓库拆分并加上标题"""
+    summarizer, completions = make_summarizer(
+        monkeypatch, lambda kwargs: json.dumps({"o/a": "A的总结", "o/b": " B的总结 "})
+    )
+
+    summaries = asyncio.run(summarizer.summarize_many({"o/a": make_commits("a"), "o/b": make_commits("b")}))
+
+    assert summaries["o/a"] == summarizer._wrap_summary("o/a", "A的总结")
+    assert summaries["o/b"] == summarizer._wrap_summary("o/b", "B的总结")
+    assert len(completions.calls) == 1
+    assert completions.calls[0]["response_format"] == {"type": "json_object"}
+
+
+def test_summarize_many_falls_back_for_missing_and_invalid(monkeypatch):
+    """缺少的仓库和非字符串结果逐个重新生成"""
+    summarizer, completions = make_summarizer(
+        monkeypatch, lambda kwargs: json.dumps({"o/a": "A的总结", "o/b": ["不是字符串"]})
+    )
+
+    repos = {"o/a": make_commits("a"), "o/b": make_commits("b"), "o/c": make_commits("c")}
+    summaries = asyncio.run(summarizer.summarize_many(repos))
+
+    assert summaries["o/a"] == summarizer._wrap_summary("o/a", "A的总结")
+    assert summaries["o/b"] == summarizer._wrap_summary("o/b", "单独总结")
+    assert summaries["o/c"] == summarizer._wrap_summary("o/c", "单独总结")
+    assert len([call for call in completions.calls if call.get("stream")]) == 2
+
+
+def test_summarize_many_falls_back_on_invalid_json(monkeypatch):
+    """返回内容不是JSON时所有仓库逐个生成"""
+    summarizer, completions = make_summarizer(monkeypatch, lambda kwargs: "不是JSON")
+
+    summaries = asyncio.run(summarizer.summarize_many({"o/a": make_commits("a"), "o/b": make_commits("b")}))
+
+    assert summaries == {
+        "o/a": summarizer._wrap_summary("o/a", "单独总结"),
+        "o/b": summarizer._wrap_summary("o/b", "单独总结"),
+    }
+
+
+def test_summarize_many_splits_batches_under_token_limit(monkeypatch):
+    """仓库较多时分批请求，每批的max_tokens不超过上限"""
+    def answer(kwargs):
+        prompt = kwargs["messages"][1]["content"]
+        return json.dumps({f"o/r{i}": f"总结{i}" for i in range(10) if f"仓库：o/r{i}\n" in prompt})
+
+    summarizer, completions = make_summarizer(monkeypatch, answer)
+
+    repos = {f"o/r{i}": make_commits(str(i)) for i in range(10)}
+    summaries = asyncio.run(summarizer.summarize_many(repos))
+
+    calls = batch_calls(completions)
+    assert len(calls) == 2
+    assert all(call["max_tokens"] <= ai_summarizer._MAX_COMPLETION_TOKENS for call in calls)
+    assert summaries == {f"o/r{i}": summarizer._wrap_summary(f"o/r{i}", f"总结{i}") for i in range(10)}
+
+
+def test_summarize_many_disabled_uses_simple_summary(monkeypatch):
+    """未配置API密钥时不调用模型"""
+    summarizer, completions = make_summarizer(monkeypatch, lambda kwargs: "{}")
+    summarizer.enabled = False
+
+    summaries = asyncio.run(summarizer.summarize_many({"o/a": make_commits("a")}))
+
+    assert summaries["o/a"] == summarizer._generate_simple_summary("o/a", make_commits("a"))
+    assert completions.calls == []
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
@@ -24,7 +24,7 @@ def test_config_parsing():
     }
     
     config_obj1 = Config(**config1)
-    repo_configs1 = config_obj1.get_repo_configs()
+    repo_configs1 = config_obj1.repo_configs
     
     for rc in repo_configs1:
         branch_info = ", ".join(rc.branches) if rc.branches != ["*"] else "所有分支"
@@ -49,7 +49,7 @@ def test_config_parsing():
     }
     
     config_obj2 = Config(**config2)
-    repo_configs2 = config_obj2.get_repo_configs()
+    repo_configs2 = config_obj2.repo_configs
     
     for rc in repo_configs2:
         branch_info = ", ".join(rc.branches) if rc.branches != ["*"] else "所有分支"
@@ -72,7 +72,7 @@ def test_config_parsing():
     }
     
     config_obj3 = Config(**config3)
-    repo_configs3 = config_obj3.get_repo_configs()
+    repo_configs3 = config_obj3.repo_configs
     
     for rc in repo_configs3:
         branch_info = ", ".join(rc.branches) if rc.branches != ["*"] else "所有分支"
@@ -94,7 +94,7 @@ def test_config_parsing():
     }
     
     config_obj4 = Config(**config4)
-    repo_configs4 = config_obj4.get_repo_configs()
+    repo_configs4 = config_obj4.repo_configs
     
     for rc in repo_configs4:
         branch_info = ", ".join(rc.branches) if rc.branches != ["*"] else "所有分支"
@@ -119,7 +119,7 @@ def test_config_parsing():
     }
     
     config_obj5 = Config(**config5)
-    repo_configs5 = config_obj5.get_repo_configs()
+    repo_configs5 = config_obj5.repo_configs
     
     for rc in repo_configs5:
         branch_info = ", ".join(rc.branches) if rc.branches != ["*"] else "所有分支"
@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+测试GitHub监控模块（使用模拟的HTTP会话，不访问网络）
+"""
+import asyncio
+import re
+import sys
+from datetime import datetime, timezone
+sys.path.append("..")
+
+import orjson
+
+from src.config import RepoConfig
+from src.database import Database
+from src.github_monitor import GitHubMonitor
+
+
+class FakeResponse:
+    """模拟 aiohttp.ClientResponse"""
+
+    def __init__(self, status=200, body=None, headers=None, text=None):
+        self.status = status
+        self.headers = headers or {}
+        if text is not None:
+            self._body = text.encode()
+        else:
+            self._body = orjson.dumps(body) if body is not None else b""
+
+    async def read(self):
+        return self._body
+
+    async def text(self):
+        return self._body.decode()
+
+    def release(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    """按 (方法, URL路径正则) 分发请求的模拟会话，记录所有请求"""
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+        self.closed = False
+
+    async def request(self, method, url, **kwargs):
+        path = url.replace("https://api.github.com", "")
+        self.calls.append((method, path, kwargs))
+        for (route_method, pattern), handler in self.routes.items():
+            if route_method == method and re.fullmatch(pattern, path):
+                return handler(path, kwargs)
+        return FakeResponse(404)
+
+    async def close(self):
+        self.closed = True
+
+
+class RecordingLimiter:
+    """记录retune调用的限流器"""
+
+    def __init__(self):
+        self.retuned = []
+
+    async def acquire(self, tokens=1):
+        pass
+
+    def retune(self, rate):
+        self.retuned.append(rate)
+
+
+def make_monitor(routes, db=None, rate_limiter=None):
+    """创建使用模拟会话的监控器"""
+    monitor = GitHubMonitor("test_token", db, rate_limiter)
+    session = FakeSession(routes)
+
+    async def ensure_session():
+        return session
+
+    monitor._ensure_session = ensure_session
+    return monitor, session
+
+
+def graphql_node(char, date):
+    return {
+        "oid": char * 40,
+        "message": f"提交 {char}\n",
+        "url": f"https://github.com/o/r/commit/{char * 40}",
+        "additions": 3,
+        "deletions": 1,
+        "author": {"name": "a", "email": "a@example.com", "date": date},
+    }
+
+
+def history(*nodes):
+    return {"target": {"history": {"nodes": list(nodes)}}}
+
+
+def graphql_route(payload, status=200, headers=None):
+    return {("POST", "/graphql"): lambda path, kwargs: FakeResponse(status, payload, headers)}
+
+
+def test_bulk_query_building():
+    """每个仓库和分支使用独立别名，'*' 对应默认分支，since按UTC格式化"""
+    monitor, session = make_monitor(graphql_route({"data": {}}))
+    repo_configs = [
+        RepoConfig(repo="o/one", branches=["*"]),
+        RepoConfig(repo="o/two", branches=["main", "dev"]),
+    ]
+    since = datetime(2024, 1, 2, 3, 4, 5, tzinfo=timezone.utc)
+
+    asyncio.run(monitor.fetch_bulk_commits(repo_configs, {"o/one": since, "o/two": None}))
+
+    query = session.calls[0][2]["json"]["query"]
+    assert 'r0: repository(owner: "o", name: "one") { b0: defaultBranchRef' in query
+    assert 'history(first: 30, since: "2024-01-02T03:04:05Z")' in query
+    assert 'r1: repository(owner: "o", name: "two")' in query
+    assert 'b0: ref(qualifiedName: "refs/heads/main")' in query
+    assert 'b1: ref(qualifiedName: "refs/heads/dev")' in query
+    assert "additions deletions" in query
+
+
+def test_bulk_parsing_cutoff_and_order():
+    """截止到上次处理的提交，结果按时间顺序排列并包含变更统计"""
+    payload = {"data": {"r0": {"b0": history(
+        graphql_node("c", "2024-01-03T08:00:00+08:00"),
+        graphql_node("b", "2024-01-02T00:00:00Z"),
+        graphql_node("a", "2024-01-01T00:00:00Z"),
+    )}}}
+    monitor, _ = make_monitor(graphql_route(payload))
+
+    result = asyncio.run(monitor.fetch_bulk_commits(
+        [RepoConfig(repo="o/r", branches=["*"])], {}, {"o/r": "a" * 40}
+    ))
+
+    commits = result["o/r"]
+    assert [commit["sha"] for commit in commits] == ["bbbbbbb", "ccccccc"]
+    assert commits[1]["date"] == "2024-01-03T00:00:00Z"
+    assert commits[1]["message"] == "提交 c"
+    assert commits[0]["stats"] == {"additions": 3, "deletions": 1, "total": 4}
+    assert commits[0]["files"] == []
+
+
+def test_bulk_multi_branch_dedup_and_sort():
+    """多个分支上的同一提交只保留一次，合并结果按时间排序"""
+    payload = {"data": {"r0": {
+        "b0": history(graphql_node("c", "2024-01-03T00:00:00Z"), graphql_node("a", "2024-01-01T00:00:00Z")),
+        "b1": history(graphql_node("b", "2024-01-02T00:00:00Z"), graphql_node("a", "2024-01-01T00:00:00Z")),
+    }}}
+    monitor, _ = make_monitor(graphql_route(payload))
+
+    result = asyncio.run(monitor.fetch_bulk_commits([RepoConfig(repo="o/r", branches=["main", "dev"])], {}))
+
+    assert [commit["sha"] for commit in result["o/r"]] == ["aaaaaaa", "bbbbbbb", "ccccccc"]
+
+
+def test_bulk_missing_repo_or_branch_falls_back():
+    """仓库或分支不存在时不在结果中，其余仓库照常返回（errors与部分data同时存在）"""
+    payload = {
+        "data": {
+            "r0": None,
+            "r1": {"b0": history(graphql_node("a", "2024-01-01T00:00:00Z")), "b1": None},
+            "r2": {"b0": history(graphql_node("b", "2024-01-02T00:00:00Z"))},
+        },
+        "errors": [{"type": "NOT_FOUND", "path": ["r0"]}],
+    }
+    monitor, _ = make_monitor(graphql_route(payload))
+    repo_configs = [
+        RepoConfig(repo="o/missing", branches=["*"]),
+        RepoConfig(repo="o/partial", branches=["main", "gone"]),
+        RepoConfig(repo="o/ok", branches=["*"]),
+    ]
+
+    result = asyncio.run(monitor.fetch_bulk_commits(repo_configs, {}))
+
+    assert list(result) == ["o/ok"]
+    assert [commit["sha"] for commit in result["o/ok"]] == ["bbbbbbb"]
+
+
+def test_bulk_request_failure_returns_empty():
+    """请求失败时返回空结果，由调用方回退到REST接口"""
+    monitor, _ = make_monitor(graphql_route({"message": "Bad credentials"}, status=401))
+
+    assert asyncio.run(monitor.fetch_bulk_commits([RepoConfig(repo="o/r")], {})) == {}
+
+
+def test_bulk_requires_token():
+    """未配置token时不发送GraphQL请求"""
+    monitor, session = make_monitor(graphql_route({"data": {}}))
+    monitor.token = ""
+
+    assert asyncio.run(monitor.fetch_bulk_commits([RepoConfig(repo="o/r")], {})) == {}
+    assert session.calls == []
+
+
+def test_bulk_does_not_retune_rest_limiter():
+    """GraphQL的配额响应头不影响REST请求的限流速率"""
+    headers = {"X-RateLimit-Remaining": "0", "X-RateLimit-Reset": "9999999999"}
+    limiter = RecordingLimiter()
+    monitor, _ = make_monitor(graphql_route({"data": {}}, headers=headers), rate_limiter=limiter)
+
+    asyncio.run(monitor.fetch_bulk_commits([RepoConfig(repo="o/r")], {}))
+
+    assert limiter.retuned == []
+    assert monitor._rate_reset_at is None
+
+
+def rest_commit(char, date="2024-01-01T00:00:00Z", files=None):
+    """REST接口格式的提交数据"""
+    data = {
+        "sha": char * 40,
+        "html_url": f"https://github.com/o/r/commit/{char * 40}",
+        "commit": {"message": f"提交 {char}", "author": {"name": "a", "email": "a@example.com", "date": date}},
+    }
+    if files is not None:
+        data["files"] = files
+    return data
+
+
+def lite_commit(char):
+    return GitHubMonitor("")._format_commit(rest_commit(char))
+
+
+def test_hydrate_files_keeps_order_and_failures():
+    """只获取前top_k个提交的详情，失败的提交保留原数据，顺序不变"""
+    def detail(path, kwargs):
+        char = path[-1]
+        if char == "b":
+            return FakeResponse(500)
+        return FakeResponse(200, rest_commit(char, files=[{"filename": f"{char}.py", "status": "modified"}]))
+
+    monitor, session = make_monitor({("GET", r"/repos/o/r/commits/\w+"): detail})
+    commits = [lite_commit(char) for char in "abcd"]
+
+    hydrated = asyncio.run(monitor.hydrate_files("o/r", commits, top_k=3))
+
+    assert [commit["sha"] for commit in hydrated] == [commit["sha"] for commit in commits]
+    assert hydrated[0]["files"][0]["filename"] == "a.py"
+    assert hydrated[1] is commits[1]
+    assert hydrated[2]["files"][0]["filename"] == "c.py"
+    assert hydrated[3] is commits[3]
+    assert len(session.calls) == 3
+
+
+
+BASE_SHA = "a" * 40
+COMPARE = r"/repos/o/r/compare/a{40}\.\.\.HEAD"
+COMMITS = r"/repos/o/r/commits"
+
+
+def compare_route(status_text, commits=(), files=None, status=200, headers=None):
+    payload = {"status": status_text, "commits": list(commits), "files": files or []}
+    return {("GET", COMPARE): lambda path, kwargs: FakeResponse(status, payload, headers)}
+
+
+def list_route(*commits):
+    return {("GET", COMMITS): lambda path, kwargs: FakeResponse(200, list(commits))}
+
+
+def list_new(monitor, etag=None):
+    return asyncio.run(monitor.list_new_commits_lite("o/r", None, BASE_SHA, ["*"], etag))
+
+
+def test_compare_ahead_returns_commits_in_order(tmp_path):
+    """head领先时返回比较结果中的提交，多个提交时不附带文件、不写缓存"""
+    db = Database(str(tmp_path / "data.db"))
+    monitor, session = make_monitor(
+        compare_route("ahead", [rest_commit("b"), rest_commit("c")], files=[{"filename": "x", "status": "added"}],
+                      headers={"ETag": '"cmp"'}),
+        db=db
+    )
+
+    commits = list_new(monitor)
+
+    assert [commit["sha"] for commit in commits] == ["bbbbbbb", "ccccccc"]
+    assert all(commit["files"] == [] for commit in commits)
+    assert monitor._commit_cache == {}
+    assert db.get_etag("o/r") is None  # 有新提交时不保存ETag
+    assert [call[1] for call in session.calls] == [f"/repos/o/r/compare/{BASE_SHA}...HEAD"]
+
+
+def test_compare_single_commit_attaches_and_caches_files(tmp_path):
+    """只有一个新提交时附带比较结果的文件变更，并写入内存和数据库缓存"""
+    db = Database(str(tmp_path / "data.db"))
+    files = [
+        {"filename": "a.py", "status": "modified", "additions": 3, "deletions": 1, "changes": 4},
+        {"filename": "b.py", "status": "added", "additions": 2, "deletions": 0, "changes": 2},
+    ]
+    monitor, _ = make_monitor(compare_route("ahead", [rest_commit("b")], files=files), db=db)
+
+    commits = list_new(monitor)
+
+    assert len(commits) == 1
+    assert [file["filename"] for file in commits[0]["files"]] == ["a.py", "b.py"]
+    assert commits[0]["stats"] == {"additions": 5, "deletions": 1, "total": 6}
+    assert monitor._commit_cache["b" * 40] == commits[0]
+    assert db.get_commit("b" * 40) == commits[0]
+
+
+def test_compare_identical_stores_etag(tmp_path):
+    """没有新提交时保存比较接口的ETag，下次检查发送条件请求"""
+    db = Database(str(tmp_path / "data.db"))
+
+    def compare(path, kwargs):
+        if (kwargs.get("headers") or {}).get("If-None-Match") == '"same"':
+            return FakeResponse(304)
+        return FakeResponse(200, {"status": "identical", "commits": [], "files": []}, {"ETag": '"same"'})
+
+    monitor, session = make_monitor({("GET", COMPARE): compare}, db=db)
+
+    assert list_new(monitor) == []
+    assert db.get_etag("o/r") == '"same"'
+    assert list_new(monitor) == []
+    assert session.calls[1][2]["headers"] == {"If-None-Match": '"same"'}
+    assert len(session.calls) == 2  # 304后不再请求提交列表
+
+
+def test_compare_unusable_falls_back_to_list(tmp_path):
+    """分叉、落后或请求失败时回退到提交列表，且不向列表接口发送比较接口的ETag"""
+    for route in (compare_route("diverged"), compare_route("behind"), compare_route("ahead", status=404)):
+        db = Database(str(tmp_path / "data.db"))
+        monitor, session = make_monitor(
+            {**route, **list_route(rest_commit("c"), rest_commit("b"), rest_commit("a"))}, db=db
+        )
+
+        commits = list_new(monitor, etag='"cmp"')
+
+        assert [commit["sha"] for commit in commits] == ["bbbbbbb", "ccccccc"]
+        list_call = session.calls[-1]
+        assert list_call[1] == COMMITS
+        assert not list_call[2].get("headers")
+        assert db.get_etag("o/r") is None
+
+
+def test_compare_truncates_to_newest_commits():
+    """比较接口返回的提交过多时只保留最新的30个，最后一个仍是head"""
+    chars = [chr(ord("A") + i) for i in range(26)] + [chr(ord("a") + i) for i in range(1, 15)]
+    monitor, _ = make_monitor(compare_route("ahead", [rest_commit(char) for char in chars]))
+
+    commits = list_new(monitor)
+
+    assert len(commits) == 30
+    assert commits[-1]["full_sha"] == chars[-1] * 40
+    assert commits[0]["full_sha"] == chars[-30] * 40
+
+
+if __name__ == "__main__":
+    import pytest
+    sys.exit(pytest.main([__file__, "-q"]))
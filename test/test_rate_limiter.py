@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+测试令牌桶限流器
+"""
+import asyncio
+import sys
+sys.path.append("..")
+
+import pytest
+
+import src.rate_limiter as rate_limiter
+from src.rate_limiter import AsyncLeakyBucket
+
+
+class FakeClock:
+    """模拟时钟：sleep只推进时间，不真正等待"""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", fake.sleep)
+    return fake
+
+
+def test_burst_capacity_without_waiting(clock):
+    """突发容量内的请求不等待"""
+    bucket = AsyncLeakyBucket(1, 3)
+
+    async def run():
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(run())
+    assert clock.sleeps == []
+
+
+def test_waits_for_refill_when_empty(clock):
+    """令牌耗尽后按速率等待"""
+    bucket = AsyncLeakyBucket(2, 1)
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    asyncio.run(run())
+    assert clock.sleeps == [pytest.approx(0.5)]
+
+
+def test_refill_is_capped_at_capacity(clock):
+    """长时间空闲后最多累积capacity个令牌"""
+    bucket = AsyncLeakyBucket(1, 2)
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+        clock.now += 100
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(run())
+    assert clock.sleeps == [pytest.approx(1.0)]
+
+
+def test_retune_is_bounded(clock):
+    """动态调整的速率不超过配置值，也不会降到0"""
+    bucket = AsyncLeakyBucket(2, 1)
+
+    bucket.retune(10)
+    assert bucket.rate == 2
+    bucket.retune(0.5)
+    assert bucket.rate == 0.5
+    bucket.retune(0)
+    assert bucket.rate == pytest.approx(1e-3)
+
+
+def test_retune_slows_down_waiting(clock):
+    """调低速率后等待时间相应变长"""
+    bucket = AsyncLeakyBucket(2, 1)
+    bucket.retune(0.5)
+
+    async def run():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    asyncio.run(run())
+    assert clock.sleeps == [pytest.approx(2.0)]
+
+
+def test_invalid_parameters():
+    """速率和容量必须为正数"""
+    with pytest.raises(ValueError):
+        AsyncLeakyBucket(0, 1)
+    with pytest.raises(ValueError):
+        AsyncLeakyBucket(1, 0)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main([__file__, "-q"]))